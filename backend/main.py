@@ -4,9 +4,11 @@ Main FastAPI application entry point.
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 import logging
 
 from backend.routers import verification_router
+from backend.services.executors import shutdown_executors
 
 # Configure logging
 logging.basicConfig(
@@ -19,6 +21,8 @@ app = FastAPI(
     title="Privacy-Preserving Identity Verification API",
     description="API for privacy-preserving identity verification using blockchain and ZKP",
     version="0.1.0",
+    # Serialize responses with orjson rather than the stdlib json encoder
+    default_response_class=ORJSONResponse,
 )
 
 # Add CORS middleware
@@ -33,6 +37,11 @@ app.add_middleware(
 # Include routers
 app.include_router(verification_router.router)
 
+@app.on_event("shutdown")
+def stop_service_executors():
+    """Stop the thread pools used for blocking service calls."""
+    shutdown_executors()
+
 @app.get("/")
 async def root():
     """Root endpoint - API health check."""
@@ -2,23 +2,72 @@
 Router for handling biometric and identity verification requests.
 """
 
+import asyncio
 import logging
 import json
-from typing import Dict, List, Optional, Any
+import hashlib
+import io
+import mmap
+import re
+import orjson
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Any, Tuple
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Body, Query, Request
-from fastapi.responses import JSONResponse
+from functools import lru_cache, partial
+from cachetools import TTLCache
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Body, Query, Request
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
 
 from backend.services.blockchain_service import blockchain_service
-from backend.services.biometric_service import BiometricService
+from backend.services.biometric_service import biometric_service
 from backend.services.fraud_detection_service import fraud_detection_service
+from backend.services.executors import get_io_executor, get_cpu_executor
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
-# Create services
-biometric_service = BiometricService()
+# Size of the chunks read from an upload while fingerprinting it
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+
+# Risk profiles are polled by dashboards and apps, so repeat requests within
+# the TTL are served from memory. Entries are dropped when the user verifies.
+RISK_PROFILE_CACHE_SIZE = 100_000
+RISK_PROFILE_CACHE_TTL = 30  # seconds
+_risk_profile_cache = TTLCache(maxsize=RISK_PROFILE_CACHE_SIZE, ttl=RISK_PROFILE_CACHE_TTL)
+
+# Streamed JSON responses are sent in chunks of roughly this size
+STREAM_CHUNK_SIZE = 64 * 1024  # 64 KiB
+
+# Uploads larger than this are memory-mapped instead of read into memory.
+# Matches the size at which Starlette spools uploads to disk.
+UPLOAD_MMAP_THRESHOLD = 1 << 20  # 1 MiB
+
+# User-agent OS tokens in priority order. Mobile platforms are checked before
+# desktop ones because their user agents also contain "Linux" or "Mac OS X".
+_OS_TOKENS = (
+    ("windows", "windows"),
+    ("android", "android"),
+    ("iphone", "ios"),
+    ("ipad", "ios"),
+    ("mac", "macos"),
+    ("linux", "linux"),
+    ("ios", "ios"),
+)
+_OS_TOKEN_PATTERN = re.compile("|".join(token for token, _ in _OS_TOKENS), re.IGNORECASE)
+_OS_TOKEN_PRIORITY = {token: (rank, os_name) for rank, (token, os_name) in enumerate(_OS_TOKENS)}
+
+# Verification status writes are queued and recorded on the blockchain in
+# batches by a background writer instead of one transaction per request
+VERIFICATION_WRITE_BATCH_SIZE = 64
+VERIFICATION_WRITE_FLUSH_INTERVAL = 0.05  # seconds
+_verification_write_queue: Optional[asyncio.Queue] = None
+_verification_writer_task: Optional[asyncio.Task] = None
+
+# Second-resolution timestamp for request metadata, refreshed once a second by a
+# background task so requests don't each build and format a datetime
+_timestamp = {"value": datetime.now().isoformat(timespec="seconds")}
+_timestamp_clock_task: Optional[asyncio.Task] = None
 
 # Create router
 router = APIRouter(
@@ -41,6 +90,7 @@ class VerificationStatusResponse(BaseModel):
     is_verified: bool
     timestamp: Optional[str] = None
     risk_level: Optional[str] = None
+    transaction_hash: Optional[str] = None
 
 class AccessGrantRequest(BaseModel):
     third_party_id: str
@@ -69,70 +119,130 @@ class RiskAnalysisResponse(BaseModel):
     verification_id: str
     timestamp: str
 
+# Threats reported by the risk analysis are fixed templates, so they are built
+# once instead of being validated on every request
+_THREATS_BY_RISK_LEVEL = {
+    "high": [ThreatInfo.model_construct(
+        type="suspicious_activity_pattern",
+        confidence=0.85,
+        description="Multiple failed verification attempts from different locations"
+    )],
+    "medium": [ThreatInfo.model_construct(
+        type="unusual_device",
+        confidence=0.65,
+        description="Verification attempted from unfamiliar device"
+    )],
+}
+
+@router.on_event("startup")
+async def start_timestamp_clock():
+    """Start the background task that refreshes the cached timestamp."""
+    global _timestamp_clock_task
+    _timestamp_clock_task = asyncio.create_task(_tick_timestamp())
+
+@router.on_event("shutdown")
+async def stop_timestamp_clock():
+    """Stop refreshing the cached timestamp."""
+    global _timestamp_clock_task
+    if _timestamp_clock_task is not None:
+        _timestamp_clock_task.cancel()
+        _timestamp_clock_task = None
+
+@router.on_event("startup")
+async def start_verification_writer():
+    """Start the background task that batches verification status writes."""
+    global _verification_write_queue, _verification_writer_task
+    _verification_write_queue = asyncio.Queue()
+    _verification_writer_task = asyncio.create_task(_verification_writer(_verification_write_queue))
+
+@router.on_event("shutdown")
+async def stop_verification_writer():
+    """Flush pending verification status writes and stop the writer."""
+    global _verification_write_queue, _verification_writer_task
+    if _verification_writer_task is None:
+        return
+    
+    # Detach the queue first, so writes that arrive while the writer drains are
+    # recorded directly instead of being queued behind the sentinel, which the
+    # writer would never resolve. The sentinel lets the writer flush everything
+    # queued before it.
+    queue, writer_task = _verification_write_queue, _verification_writer_task
+    _verification_write_queue = None
+    _verification_writer_task = None
+    queue.put_nowait(None)
+    await writer_task
+
+@router.on_event("startup")
+async def warm_up_services():
+    """Warm up the fraud model before the first request arrives."""
+    await _run_cpu(fraud_detection_service.warm_up)
+
 @router.post("/face", response_model=VerificationResponse)
 async def verify_face(
     request: Request,
     user_id: str = Query(..., description="ID of the user to verify"),
-    face_image: UploadFile = File(..., description="Facial image to verify")
+    face_image: UploadFile = File(..., description="Facial image to verify"),
+    declared_country: str = Form("", alias="country", description="Country declared by the user")
 ):
     """
     Endpoint for verifying a user's face.
     
     This uses facial recognition and fraud detection to verify a user's identity.
     """
-    logger.info(f"Processing facial verification for user {user_id}")
+    logger.info("Processing facial verification for user %s", user_id)
     
     try:
-        # Read image data
-        contents = await face_image.read()
+        # Fingerprint the image without loading it into memory
+        image_hash = await _fingerprint_upload(face_image)
         
         # Collect device and request metadata for fraud analysis
-        verification_metadata = await _extract_verification_metadata(request, user_id)
+        verification_metadata = _extract_verification_metadata(request, user_id, declared_country)
+        verification_metadata["image_hash"] = image_hash
         
-        # Perform facial verification
-        verification_result = biometric_service.verify_face(user_id, contents)
-        
-        # Run fraud detection analysis
-        fraud_analysis = fraud_detection_service.analyze_verification_attempt(
-            user_id=user_id,
-            verification_data=verification_metadata,
-            image_data=contents
+        # Run the cheap fraud checks first; an attempt that is already high risk
+        # is rejected without running the biometric model
+        fraud_analysis = await _run_cpu(
+            fraud_detection_service.preflight, user_id, verification_metadata
         )
         
-        # Combine verification result with fraud analysis
-        verification_success = verification_result["success"] and fraud_analysis["risk_level"] != "high"
-        
-        # If high risk detected, override success status
+        if fraud_analysis["risk_level"] != "high":
+            # Facial verification and image analysis are independent, so run them
+            # concurrently, each on its own view of the spooled upload
+            with _upload_views(face_image, 2) as (face_view, fraud_view):
+                verification_result, fraud_analysis = await asyncio.gather(
+                    biometric_service.verify_face_async(user_id, face_view),
+                    _run_cpu(
+                        fraud_detection_service.analyze_image,
+                        user_id, verification_metadata, fraud_view, fraud_analysis
+                    )
+                )
+        
+        # The attempt is now part of the user's history
+        _risk_profile_cache.pop(user_id, None)
+        
+        # A high fraud risk overrides the facial verification result
         if fraud_analysis["risk_level"] == "high":
             verification_success = False
             message = "Verification failed due to security concerns. Please try again or contact support."
         else:
+            verification_success = verification_result["success"]
             message = verification_result.get("message", "Verification processed")
         
-        # Record verification status on blockchain
-        transaction_success = blockchain_service.update_verification_status(
-            user_id, "facial", verification_success
-        )
-        
-        if not transaction_success:
-            raise HTTPException(status_code=500, detail="Failed to record verification status")
-        
-        # Get transaction hash from the blockchain service
-        tx_hash = None
-        if user_id in blockchain_service.verification_cache and "facial" in blockchain_service.verification_cache[user_id]:
-            tx_hash = blockchain_service.verification_cache[user_id]["facial"].get("transaction_hash")
+        # Record verification status on blockchain, batched with concurrent
+        # verifications into one transaction
+        tx_hash = await _record_verification_status(user_id, "facial", verification_success)
         
-        return VerificationResponse(
+        return _model_response(VerificationResponse.model_construct(
             success=verification_success,
             message=message,
             transaction_hash=tx_hash,
             risk_level=fraud_analysis["risk_level"],
             risk_score=fraud_analysis["risk_score"],
             verification_id=fraud_analysis["verification_id"]
-        )
+        ))
         
     except Exception as e:
-        logger.error(f"Error during facial verification: {str(e)}")
+        logger.exception("Error during facial verification: %s", e)
         raise HTTPException(status_code=500, detail=f"Verification processing error: {str(e)}")
 
 @router.post("/document", response_model=VerificationResponse)
@@ -140,67 +250,69 @@ async def verify_document(
     request: Request,
     user_id: str = Query(..., description="ID of the user to verify"),
     id_document: UploadFile = File(..., description="ID document to verify"),
-    document_type: str = Query(..., description="Type of document (passport, driver_license, id_card)")
+    document_type: str = Query(..., description="Type of document (passport, driver_license, id_card)"),
+    declared_country: str = Form("", alias="country", description="Country declared by the user")
 ):
     """
     Endpoint for verifying an ID document.
     
     This extracts information from an ID document and verifies its authenticity while performing fraud detection.
     """
-    logger.info(f"Processing document verification for user {user_id}")
+    logger.info("Processing document verification for user %s", user_id)
     
     try:
-        # Read document image
-        contents = await id_document.read()
+        # Fingerprint the document image without loading it into memory
+        image_hash = await _fingerprint_upload(id_document)
         
         # Collect device and request metadata for fraud analysis
-        verification_metadata = await _extract_verification_metadata(request, user_id)
+        verification_metadata = _extract_verification_metadata(request, user_id, declared_country)
         verification_metadata["document_type"] = document_type
+        verification_metadata["image_hash"] = image_hash
         
-        # Verify document
-        document_verification = biometric_service.verify_id_document(contents, document_type)
-        
-        # Run fraud detection analysis
-        fraud_analysis = fraud_detection_service.analyze_verification_attempt(
-            user_id=user_id,
-            verification_data=verification_metadata,
-            image_data=contents
+        # Run the cheap fraud checks first; an attempt that is already high risk
+        # is rejected without verifying the document
+        fraud_analysis = await _run_cpu(
+            fraud_detection_service.preflight, user_id, verification_metadata
         )
         
-        # Combine results - document must be verified and not high risk
-        verification_success = document_verification["success"] and fraud_analysis["risk_level"] != "high"
+        if fraud_analysis["risk_level"] != "high":
+            # Document verification and image analysis are independent, so run them
+            # concurrently, each on its own view of the spooled upload
+            with _upload_views(id_document, 2) as (document_view, fraud_view):
+                document_verification, fraud_analysis = await asyncio.gather(
+                    _run_cpu(biometric_service.verify_id_document, document_view, document_type),
+                    _run_cpu(
+                        fraud_detection_service.analyze_image,
+                        user_id, verification_metadata, fraud_view, fraud_analysis
+                    )
+                )
+        
+        # The attempt is now part of the user's history
+        _risk_profile_cache.pop(user_id, None)
         
-        # Determine message based on results
+        # Combine results - document must be verified and not high risk
         if fraud_analysis["risk_level"] == "high":
             message = "Document verification failed due to security concerns. Please try again or contact support."
             verification_success = False
         else:
+            verification_success = document_verification["success"]
             message = document_verification.get("message", "Document verification processed")
         
-        # Record verification status on blockchain
-        transaction_success = blockchain_service.update_verification_status(
-            user_id, "document", verification_success
-        )
-        
-        if not transaction_success:
-            raise HTTPException(status_code=500, detail="Failed to record verification status")
-        
-        # Get transaction hash from the blockchain service
-        tx_hash = None
-        if user_id in blockchain_service.verification_cache and "document" in blockchain_service.verification_cache[user_id]:
-            tx_hash = blockchain_service.verification_cache[user_id]["document"].get("transaction_hash")
+        # Record verification status on blockchain, batched with concurrent
+        # verifications into one transaction
+        tx_hash = await _record_verification_status(user_id, "document", verification_success)
         
-        return VerificationResponse(
+        return _model_response(VerificationResponse.model_construct(
             success=verification_success,
             message=message,
             transaction_hash=tx_hash,
             risk_level=fraud_analysis["risk_level"],
             risk_score=fraud_analysis["risk_score"],
             verification_id=fraud_analysis["verification_id"]
-        )
+        ))
         
     except Exception as e:
-        logger.error(f"Error during document verification: {str(e)}")
+        logger.exception("Error during document verification: %s", e)
         raise HTTPException(status_code=500, detail=f"Verification processing error: {str(e)}")
 
 @router.get("/status/{verification_type}", response_model=VerificationStatusResponse)
@@ -211,31 +323,33 @@ async def check_verification_status(
     """
     Check the verification status for a user.
     """
-    logger.info(f"Checking {verification_type} verification status for user {user_id}")
+    logger.info("Checking %s verification status for user %s", verification_type, user_id)
     
     try:
         # Get status from blockchain
-        is_verified = blockchain_service.get_verification_status(user_id, verification_type)
+        is_verified = await _run_io(
+            blockchain_service.get_verification_status, user_id, verification_type
+        )
         
         # Get user's risk profile from fraud detection service
-        risk_profile = fraud_detection_service.get_user_risk_profile(user_id)
+        risk_profile = await _get_risk_profile(user_id)
         
-        # Get timestamp from cache if available
-        timestamp = None
-        if user_id in blockchain_service.verification_cache:
-            if verification_type in blockchain_service.verification_cache[user_id]:
-                timestamp = blockchain_service.verification_cache[user_id][verification_type].get("timestamp")
+        # Get timestamp and transaction hash from cache if available
+        record = blockchain_service.get_cached_verification(user_id, verification_type)
+        timestamp = record.get("timestamp")
+        tx_hash = record.get("transaction_hash")
         
-        return VerificationStatusResponse(
+        return _model_response(VerificationStatusResponse.model_construct(
             user_id=user_id,
             verification_type=verification_type,
             is_verified=is_verified,
             timestamp=timestamp,
-            risk_level=risk_profile.get("risk_level")
-        )
+            risk_level=risk_profile.get("risk_level"),
+            transaction_hash=tx_hash
+        ))
         
     except Exception as e:
-        logger.error(f"Error checking verification status: {str(e)}")
+        logger.exception("Error checking verification status: %s", e)
         raise HTTPException(status_code=500, detail=f"Error checking verification status: {str(e)}")
 
 @router.post("/grant-access", response_model=VerificationResponse)
@@ -246,11 +360,12 @@ async def grant_access(
     """
     Grant access to a third party for specific data types.
     """
-    logger.info(f"User {user_id} granting access to {request.third_party_id}")
+    logger.info("User %s granting access to %s", user_id, request.third_party_id)
     
     try:
         # Record access grant on blockchain
-        success = blockchain_service.grant_access(
+        success = await _run_io(
+            blockchain_service.grant_access,
             user_id, 
             request.third_party_id,
             request.data_types,
@@ -261,18 +376,16 @@ async def grant_access(
             raise HTTPException(status_code=500, detail="Failed to grant access")
         
         # Get transaction hash
-        tx_hash = None
-        if user_id in blockchain_service.access_grants_cache and request.third_party_id in blockchain_service.access_grants_cache[user_id]:
-            tx_hash = blockchain_service.access_grants_cache[user_id][request.third_party_id].get("transaction_hash")
+        tx_hash = blockchain_service.get_cached_access_grant(user_id, request.third_party_id).get("transaction_hash")
         
-        return VerificationResponse(
+        return _model_response(VerificationResponse.model_construct(
             success=True,
             message=f"Access granted to {request.third_party_id} for data types: {', '.join(request.data_types)}",
             transaction_hash=tx_hash
-        )
+        ))
         
     except Exception as e:
-        logger.error(f"Error granting access: {str(e)}")
+        logger.exception("Error granting access: %s", e)
         raise HTTPException(status_code=500, detail=f"Error granting access: {str(e)}")
 
 @router.post("/revoke-access/{third_party_id}", response_model=VerificationResponse)
@@ -283,28 +396,26 @@ async def revoke_access(
     """
     Revoke access from a third party.
     """
-    logger.info(f"User {user_id} revoking access from {third_party_id}")
+    logger.info("User %s revoking access from %s", user_id, third_party_id)
     
     try:
         # Record access revocation on blockchain
-        success = blockchain_service.revoke_access(user_id, third_party_id)
+        success = await _run_io(blockchain_service.revoke_access, user_id, third_party_id)
         
         if not success:
             raise HTTPException(status_code=500, detail="Failed to revoke access")
         
         # Get transaction hash
-        tx_hash = None
-        if user_id in blockchain_service.access_grants_cache and third_party_id in blockchain_service.access_grants_cache[user_id]:
-            tx_hash = blockchain_service.access_grants_cache[user_id][third_party_id].get("revoke_transaction_hash")
+        tx_hash = blockchain_service.get_cached_access_grant(user_id, third_party_id).get("revoke_transaction_hash")
         
-        return VerificationResponse(
+        return _model_response(VerificationResponse.model_construct(
             success=True,
             message=f"Access revoked from {third_party_id}",
             transaction_hash=tx_hash
-        )
+        ))
         
     except Exception as e:
-        logger.error(f"Error revoking access: {str(e)}")
+        logger.exception("Error revoking access: %s", e)
         raise HTTPException(status_code=500, detail=f"Error revoking access: {str(e)}")
 
 @router.post("/zkp-verify", response_model=VerificationResponse)
@@ -317,11 +428,13 @@ async def record_zkp_verification(
     
     This allows proving a user's attribute without revealing the actual data.
     """
-    logger.info(f"Recording ZKP verification for user {user_id} by {request.third_party_id}")
+    logger.info("Recording ZKP verification for user %s by %s", user_id, request.third_party_id)
     
     try:
         # Verify that the third party has access to this data type
-        has_access = blockchain_service.check_access(user_id, request.third_party_id, request.data_type)
+        has_access = await _run_io(
+            blockchain_service.check_access, user_id, request.third_party_id, request.data_type
+        )
         
         if not has_access:
             raise HTTPException(
@@ -330,7 +443,8 @@ async def record_zkp_verification(
             )
         
         # Record the verification on blockchain
-        success = blockchain_service.record_zkp_verification(
+        success = await _run_io(
+            blockchain_service.record_zkp_verification,
             user_id, 
             request.third_party_id,
             request.proof_hash,
@@ -341,16 +455,16 @@ async def record_zkp_verification(
             raise HTTPException(status_code=500, detail="Failed to record ZKP verification")
         
         # No transaction hash returned in this mock, but in a real implementation we would get it
-        return VerificationResponse(
+        return _model_response(VerificationResponse.model_construct(
             success=True,
             message=f"ZKP verification for {request.data_type} recorded successfully",
             transaction_hash=None  # In a real implementation, this would be the transaction hash
-        )
+        ))
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error recording ZKP verification: {str(e)}")
+        logger.exception("Error recording ZKP verification: %s", e)
         raise HTTPException(status_code=500, detail=f"Error recording ZKP verification: {str(e)}")
 
 @router.get("/history", response_model=VerificationHistoryResponse)
@@ -360,19 +474,21 @@ async def get_verification_history(
     """
     Get verification history for a user.
     """
-    logger.info(f"Getting verification history for user {user_id}")
+    logger.info("Getting verification history for user %s", user_id)
     
     try:
-        # Get verification history from blockchain
-        history = blockchain_service.get_verification_history(user_id)
-        
-        return VerificationHistoryResponse(
-            user_id=user_id,
-            history=history
+        # Look up the history before responding, so that a failed lookup is a
+        # 500 rather than a truncated 200; the records are then streamed
+        # instead of building the whole list first
+        history = await _run_io(blockchain_service.iter_verification_history, user_id)
+        
+        return StreamingResponse(
+            _iter_json_object((("user_id", user_id), ("history", history))),
+            media_type="application/json"
         )
         
     except Exception as e:
-        logger.error(f"Error getting verification history: {str(e)}")
+        logger.exception("Error getting verification history: %s", e)
         raise HTTPException(status_code=500, detail=f"Error getting verification history: {str(e)}")
 
 @router.get("/risk-analysis", response_model=RiskAnalysisResponse)
@@ -383,89 +499,270 @@ async def get_user_risk_analysis(
     """
     Get detailed risk analysis for a user or specific verification.
     """
-    logger.info(f"Getting risk analysis for user {user_id}")
+    logger.info("Getting risk analysis for user %s", user_id)
     
     try:
         if verification_id:
             # In a real system, we would retrieve the specific verification from a database
             # For now, just return the user's overall risk profile
-            logger.info(f"Specific verification ID not supported yet, returning overall profile")
+            logger.info("Specific verification ID not supported yet, returning overall profile")
         
         # Get user risk profile
-        risk_profile = fraud_detection_service.get_user_risk_profile(user_id)
+        risk_profile = await _get_risk_profile(user_id)
         
         # Convert to response format
-        threats = []
-        
         # This is simulated; in a real implementation, we would get threats from the risk profile
-        if risk_profile.get("risk_level") == "high":
-            threats.append(ThreatInfo(
-                type="suspicious_activity_pattern",
-                confidence=0.85,
-                description="Multiple failed verification attempts from different locations"
-            ))
-        elif risk_profile.get("risk_level") == "medium":
-            threats.append(ThreatInfo(
-                type="unusual_device",
-                confidence=0.65,
-                description="Verification attempted from unfamiliar device"
-            ))
-        
-        return RiskAnalysisResponse(
+        threats = _THREATS_BY_RISK_LEVEL.get(risk_profile.get("risk_level"), [])
+        
+        return _model_response(RiskAnalysisResponse.model_construct(
             user_id=user_id,
             risk_level=risk_profile.get("risk_level", "unknown"),
             risk_score=risk_profile.get("risk_score", 0.0),
             threats_detected=threats,
             verification_id=verification_id or "overall_profile",
             timestamp=risk_profile.get("last_verification") or "N/A"
-        )
+        ))
         
     except Exception as e:
-        logger.error(f"Error getting risk analysis: {str(e)}")
+        logger.exception("Error getting risk analysis: %s", e)
         raise HTTPException(status_code=500, detail=f"Error getting risk analysis: {str(e)}")
 
-@router.get("/audit", response_model=Dict[str, Any])
+@router.get("/audit")
 async def get_verification_audit(
     user_id: str = Query(..., description="ID of the user to get audit for")
 ):
     """
     Get a complete audit of a user's verifications and access grants.
     """
-    logger.info(f"Getting verification audit for user {user_id}")
+    logger.info("Getting verification audit for user %s", user_id)
     
     try:
-        # Get the audit from blockchain service
-        audit = blockchain_service.get_user_verification_audit(user_id)
+        # Look up every section before responding, then stream the audit
+        # section by section
+        audit = await _run_io(blockchain_service.iter_user_verification_audit, user_id)
         
-        return audit
+        return StreamingResponse(_iter_json_object(audit), media_type="application/json")
         
     except Exception as e:
-        logger.error(f"Error getting verification audit: {str(e)}")
+        logger.exception("Error getting verification audit: %s", e)
         raise HTTPException(status_code=500, detail=f"Error getting verification audit: {str(e)}")
 
-async def _extract_verification_metadata(request: Request, user_id: str) -> Dict[str, Any]:
+def _iter_json_object(fields: Iterable[Tuple[str, Any]]) -> Iterator[bytes]:
+    """
+    Encode (key, value) pairs as a JSON object in chunks.
+    
+    Values that are iterators are encoded as arrays item by item, so long
+    histories are sent without first building them in memory. Starlette runs
+    this synchronous generator in its threadpool. Errors are not caught: once
+    the response has started, failing aborts it rather than sending an
+    incomplete object that parses as valid JSON.
+    """
+    buffer = bytearray(b"{")
+    for index, (key, value) in enumerate(fields):
+        if index:
+            buffer += b","
+        buffer += orjson.dumps(key) + b":"
+        
+        if isinstance(value, Iterator):
+            buffer += b"["
+            for item_index, item in enumerate(value):
+                if item_index:
+                    buffer += b","
+                buffer += orjson.dumps(item)
+                if len(buffer) >= STREAM_CHUNK_SIZE:
+                    yield bytes(buffer)
+                    buffer.clear()
+            buffer += b"]"
+        else:
+            buffer += orjson.dumps(value)
+    
+    buffer += b"}"
+    yield bytes(buffer)
+
+async def _fingerprint_upload(upload: UploadFile) -> str:
+    """
+    Compute the SHA-256 of an uploaded file chunk by chunk.
+    
+    Starlette already spools multipart uploads to a SpooledTemporaryFile, so the
+    file is streamed from there in fixed-size chunks instead of being read into a
+    single bytes object. The file is rewound so the services can consume it.
+    """
+    hasher = hashlib.sha256()
+    while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+        hasher.update(chunk)
+    await upload.seek(0)
+    return hasher.hexdigest()
+
+async def _tick_timestamp() -> None:
+    """Refresh the cached request timestamp once a second."""
+    while True:
+        _timestamp["value"] = datetime.now().isoformat(timespec="seconds")
+        await asyncio.sleep(1)
+
+def _current_timestamp() -> str:
+    """Return the current time as a second-resolution ISO 8601 string."""
+    if _timestamp_clock_task is None:
+        # Clock not running (app started without lifespan events)
+        return datetime.now().isoformat(timespec="seconds")
+    return _timestamp["value"]
+
+async def _record_verification_status(user_id: str, verification_type: str, status: bool) -> Optional[str]:
+    """
+    Record a verification status on the blockchain and return its transaction hash.
+    
+    The write joins the background writer's next batch; this waits until that
+    batch has been recorded, so the status is readable once the request returns.
+    
+    Raises:
+        HTTPException: If the status could not be recorded
+    """
+    if _verification_write_queue is None:
+        # Writer not running (app started without lifespan events); write directly
+        success = await _run_io(
+            blockchain_service.update_verification_status, user_id, verification_type, status
+        )
+        tx_hash = blockchain_service.get_cached_verification(user_id, verification_type).get("transaction_hash")
+    else:
+        result = asyncio.get_running_loop().create_future()
+        _verification_write_queue.put_nowait((user_id, verification_type, status, result))
+        success, tx_hash = await result
+    
+    if not success:
+        raise HTTPException(status_code=500, detail="Failed to record verification status")
+    
+    return tx_hash
+
+async def _verification_writer(queue: asyncio.Queue) -> None:
+    """
+    Drain queued verification status writes into batched blockchain transactions.
+    
+    After the first write of a batch arrives, the writer waits one flush interval
+    so that concurrent verifications join the same transaction. Each queued item
+    carries a future that is resolved with (success, transaction hash) once its
+    batch has been recorded. A None
+    item stops the writer once everything queued before it has been recorded.
+    """
+    stopping = False
+    while not stopping:
+        item = await queue.get()
+        if item is None:
+            break
+        
+        batch = [item]
+        await asyncio.sleep(VERIFICATION_WRITE_FLUSH_INTERVAL)
+        while not queue.empty():
+            item = queue.get_nowait()
+            if item is None:
+                stopping = True
+                break
+            batch.append(item)
+        
+        # Record in chunks of at most VERIFICATION_WRITE_BATCH_SIZE updates
+        for start in range(0, len(batch), VERIFICATION_WRITE_BATCH_SIZE):
+            chunk = batch[start:start + VERIFICATION_WRITE_BATCH_SIZE]
+            try:
+                success = await _run_io(
+                    blockchain_service.update_verification_status_batch,
+                    [update[:3] for update in chunk]
+                )
+            except Exception as e:
+                logger.exception("Error recording verification status batch: %s", e)
+                success = False
+            
+            tx_hash = None
+            if success:
+                # Every update in a batch shares the batch's transaction
+                user_id, verification_type = chunk[0][:2]
+                tx_hash = blockchain_service.get_cached_verification(
+                    user_id, verification_type
+                ).get("transaction_hash")
+            else:
+                logger.error("Failed to record batch of %d verification status updates", len(chunk))
+            
+            for *_, result in chunk:
+                # The waiting request may have been cancelled
+                if not result.done():
+                    result.set_result((success, tx_hash))
+
+async def _get_risk_profile(user_id: str) -> Dict[str, Any]:
+    """Get a user's fraud risk profile, reusing a recently computed one."""
+    risk_profile = _risk_profile_cache.get(user_id)
+    if risk_profile is None:
+        risk_profile = await _run_cpu(fraud_detection_service.get_user_risk_profile, user_id)
+        # Failed lookups are retried on the next request
+        if "error" not in risk_profile:
+            _risk_profile_cache[user_id] = risk_profile
+    return risk_profile
+
+def _run_io(func, *args, **kwargs):
+    """Run a blocking network-bound service call (blockchain) on the IO pool."""
+    return asyncio.get_running_loop().run_in_executor(get_io_executor(), partial(func, *args, **kwargs))
+
+def _run_cpu(func, *args, **kwargs):
+    """Run a compute-bound service call (biometrics, fraud analysis) on the CPU pool."""
+    return asyncio.get_running_loop().run_in_executor(get_cpu_executor(), partial(func, *args, **kwargs))
+
+def _model_response(model: BaseModel) -> ORJSONResponse:
+    """
+    Serialize a server-built response model straight to JSON.
+    
+    Response models are built with model_construct from trusted service data, and
+    returning a Response makes FastAPI skip re-validating them against the route's
+    response_model, which is still used for the OpenAPI schema. Dumping in JSON
+    mode turns values of subclassed types, such as numpy floats from the models,
+    into plain JSON types that orjson accepts.
+    """
+    return ORJSONResponse(model.model_dump(mode="json"))
+
+@contextmanager
+def _upload_views(upload: UploadFile, count: int):
+    """
+    Open independent, read-only views of a spooled upload, one per consumer.
+    
+    Each view has its own read position, so several services can read the same
+    upload from worker threads without racing on the shared file offset. Large
+    uploads, which Starlette has already spooled to disk, are memory-mapped so
+    the image is never copied into the Python heap. Small uploads are still held
+    in memory and are read once into a bytes object that all views share.
+    """
+    upload.file.seek(0, io.SEEK_END)
+    size = upload.file.tell()
+    
+    if size > UPLOAD_MMAP_THRESHOLD:
+        fd = upload.file.fileno()
+        upload.file.flush()
+        views = [mmap.mmap(fd, 0, access=mmap.ACCESS_READ) for _ in range(count)]
+    else:
+        upload.file.seek(0)
+        data = upload.file.read()
+        views = [io.BytesIO(data) for _ in range(count)]
+    
+    try:
+        yield views
+    finally:
+        for view in views:
+            view.close()
+
+def _extract_verification_metadata(request: Request, user_id: str,
+                                   declared_country: str = "") -> Dict[str, Any]:
     """
     Extract metadata from the request for fraud detection analysis.
+    
+    The declared country arrives as a form field parsed by FastAPI together with
+    the upload, so the multipart body is never parsed a second time here.
     """
     client_host = request.client.host if request.client else "unknown"
     
     # Get headers
     user_agent = request.headers.get("user-agent", "")
     
-    # Try to parse body if it's form data (this is just for demo)
-    try:
-        form = await request.form()
-        declared_country = form.get("country", "")
-    except:
-        declared_country = ""
-    
     # Build metadata object
     metadata = {
         "user_id": user_id,
         "ip_address": client_host,
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": _current_timestamp(),
         "user_agent": user_agent,
-        "device_fingerprint": f"{user_agent}:{client_host}",  # simplified fingerprint
+        "device_fingerprint": _device_fingerprint(user_agent, client_host),
         "declared_country": declared_country,
         "ip_country": "US",  # In a real implementation, this would be determined from IP
         "is_vpn": False,     # In a real implementation, this would be determined from IP
@@ -475,19 +772,27 @@ async def _extract_verification_metadata(request: Request, user_id: str) -> Dict
     
     return metadata
 
+@lru_cache(maxsize=4096)
+def _device_fingerprint(user_agent: str, client_host: str) -> str:
+    """
+    Build a simplified device fingerprint from the user agent and client address.
+    
+    A 128-bit digest gives a constant 32-character key instead of carrying the
+    full user-agent string through the fraud history.
+    """
+    return hashlib.blake2b(f"{user_agent}:{client_host}".encode(),
+                           digest_size=16).hexdigest()
+
+# Clients send a small set of recurring user agents; the bound keeps
+# randomized user agents from growing the cache without limit
+@lru_cache(maxsize=4096)
 def _extract_os_from_user_agent(user_agent: str) -> str:
     """Extract OS information from user agent string."""
-    user_agent = user_agent.lower()
+    # One case-insensitive scan; the highest-priority token found wins
+    best = None
+    for match in _OS_TOKEN_PATTERN.finditer(user_agent):
+        candidate = _OS_TOKEN_PRIORITY[match.group().lower()]
+        if best is None or candidate < best:
+            best = candidate
     
-    if "windows" in user_agent:
-        return "windows"
-    elif "mac" in user_agent:
-        return "macos"
-    elif "linux" in user_agent:
-        return "linux"
-    elif "android" in user_agent:
-        return "android"
-    elif "ios" in user_agent or "iphone" in user_agent or "ipad" in user_agent:
-        return "ios"
-    else:
-        return "unknown" 
\ No newline at end of file
+    return best[1] if best else "unknown"
@@ -3,20 +3,73 @@ Service for blockchain-based verification and privacy management.
 Uses a mock implementation that simulates blockchain behaviors.
 """
 
-import json
 import logging
 import hashlib
 import time
 import os
-import uuid
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
+import copy
+import itertools
+import threading
+from collections import defaultdict, deque
+from datetime import datetime
+from functools import lru_cache, partial
+from typing import Dict, Iterator, List, Optional, Any, Tuple
+
+import orjson
 
 # Import Web3 for type hinting but we'll use mocks instead of real transactions
 from web3 import Web3
 
 logger = logging.getLogger(__name__)
 
+# Number of user ID -> address derivations kept in memory
+ADDRESS_CACHE_SIZE = 4096
+
+SECONDS_PER_DAY = 86400
+
+# ZKP verification records kept per user, and how long they are kept
+ZKP_RECORDS_PER_USER = 1024
+ZKP_RECORD_TTL = 365 * SECONDS_PER_DAY
+
+# Optional local configuration, read once at import
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), "../config/blockchain.json")
+
+# Verification type names <-> enum values used in the contract
+_VERIFICATION_TYPE_ENUMS = {
+    'government_id': 0,
+    'document': 0,  # Alias for government_id
+    'biometric': 1,
+    'facial': 1,    # Alias for biometric
+    'address': 2
+}
+_VERIFICATION_TYPE_NAMES = {
+    0: 'government_id',
+    1: 'biometric',
+    2: 'address'
+}
+
+class VerificationEvent:
+    """
+    VerificationUpdated event in the mock event log.
+    
+    Uses __slots__ instead of a dict per event: the log grows with every
+    verification and is read through the per-user index.
+    """
+    
+    __slots__ = ("owner", "verification_type", "status", "block_number",
+                 "transaction_hash", "timestamp", "log_index")
+    
+    def __init__(self, owner: str, verification_type: int, status: int, block_number: int,
+                 transaction_hash: bytes, timestamp: float, log_index: Optional[int] = None):
+        self.owner = owner
+        self.verification_type = verification_type
+        self.status = status
+        self.block_number = block_number
+        self.transaction_hash = transaction_hash
+        self.timestamp = timestamp
+        self.log_index = log_index
+
+
 class BlockchainService:
     """
     Service for managing verification status and data access permissions
@@ -34,10 +87,13 @@ class BlockchainService:
         self.config = self._load_config()
         
         # Initialize storage for our mock blockchain
-        self.verification_cache = {}  # Mock storage for verification records
+        # Latest VerificationEvent per (user_id, verification_type); the event
+        # log is the only copy of verification records
+        self._latest_verification = {}
         self.access_grants_cache = {}  # Mock storage for access grants
         self.identities = {}  # Mock storage for identity records
-        self.zkp_verifications = []  # Mock storage for ZKP verifications
+        # Mock storage for ZKP verifications, oldest first per user
+        self.zkp_verifications = defaultdict(partial(deque, maxlen=ZKP_RECORDS_PER_USER))
         
         # Mock blockchain state
         self.current_block = 1000
@@ -48,6 +104,22 @@ class BlockchainService:
             "ZKProofVerified": []
         }
         
+        # Indices into events["VerificationUpdated"], keyed by owner address
+        self._events_by_user = defaultdict(list)
+        
+        # Writers queue (event name, event) pairs here; they are moved into
+        # self.events in batches by _flush_events() before the log is read
+        self._pending_events = deque()
+        self._events_lock = threading.Lock()
+        
+        # Writers run concurrently on the I/O thread pool; each one advances
+        # current_block and records its state in that block while holding this
+        self._block_lock = threading.Lock()
+        
+        # Transaction hashes are derived from a per-instance nonce and a counter
+        self._tx_nonce = os.urandom(16)
+        self._tx_counter = itertools.count()
+        
         self.logger.info("Mock BlockchainService initialized")
     
     def _load_config(self) -> Dict:
@@ -64,13 +136,8 @@ class BlockchainService:
             }
         }
         
-        # Try to load from local config if available
-        try:
-            with open(os.path.join(os.path.dirname(__file__), "../config/blockchain.json"), "r") as f:
-                file_config = json.load(f)
-                config.update(file_config)
-        except (FileNotFoundError, json.JSONDecodeError) as e:
-            self.logger.warning(f"Could not load blockchain config from file: {e}")
+        # Apply the local config file if one was loaded at import
+        config.update(copy.deepcopy(_FILE_CONFIG))
         
         return config
     
@@ -87,47 +154,114 @@ class BlockchainService:
             bool: True if the update was successful
         """
         try:
-            # Convert status to enum value (0=Pending, 1=Verified, 2=Rejected)
-            status_enum = 1 if status else 2
-            verification_type_enum = self._get_verification_type_enum(verification_type)
-            
             # Generate a mock transaction hash
             tx_hash = self._generate_mock_transaction_hash(user_id, verification_type)
             
             # Update the mock blockchain state
-            self.current_block += 1
-            
-            # Create user record if it doesn't exist
-            if user_id not in self.verification_cache:
-                self.verification_cache[user_id] = {}
-            
-            # Update the verification status
-            self.verification_cache[user_id][verification_type] = {
-                "status": status,
-                "timestamp": datetime.now().isoformat(),
-                "transaction_hash": tx_hash,
-                "block_number": self.current_block
-            }
+            with self._block_lock:
+                self.current_block += 1
+                self._record_verification_update(user_id, verification_type, status, tx_hash, time.time())
             
-            # Record the event for later querying
-            self.events["VerificationUpdated"].append({
-                "args": {
-                    "owner": self._user_id_to_address(user_id),
-                    "verificationType": verification_type_enum,
-                    "status": status_enum
-                },
-                "blockNumber": self.current_block,
-                "transactionHash": bytes.fromhex(tx_hash.replace("0x", "")),
-                "logIndex": len(self.events["VerificationUpdated"])
-            })
-            
-            self.logger.info(f"Updated {verification_type} verification status to {status} for user {user_id}")
+            self.logger.info("Updated %s verification status to %s for user %s", verification_type, status, user_id)
+            return True
+            
+        except Exception as e:
+            self.logger.error("Failed to update verification status: %s", e)
+            return False
+    
+    def update_verification_status_batch(self, updates: List[Tuple[str, str, bool]]) -> bool:
+        """
+        Record several verification status updates in one mock transaction.
+        
+        Mirrors a multicall transaction: every update in the batch shares the
+        same transaction hash and block.
+        
+        Args:
+            updates: (user_id, verification_type, status) tuples to record
+            
+        Returns:
+            bool: True if the batch was recorded successfully
+        """
+        try:
+            # Generate a single mock transaction hash for the whole batch
+            tx_hash = self._generate_mock_transaction_hash(*updates)
+            
+            # Update the mock blockchain state
+            with self._block_lock:
+                self.current_block += 1
+                block_number = self.current_block
+                
+                # The whole batch shares one block, so it shares one timestamp too
+                now = time.time()
+                for user_id, verification_type, status in updates:
+                    self._record_verification_update(user_id, verification_type, status, tx_hash, now)
+            
+            self.logger.info("Recorded %s verification status updates in block %s", len(updates), block_number)
             return True
             
         except Exception as e:
-            self.logger.error(f"Failed to update verification status: {e}")
+            self.logger.error("Failed to record verification status batch: %s", e)
             return False
     
+    def _record_verification_update(self, user_id: str, verification_type: str, status: bool,
+                                    tx_hash: bytes, timestamp: float) -> None:
+        """Store a verification update and its event in the current block.
+        
+        Must be called with the block lock held.
+        """
+        # Convert status to enum value (0=Pending, 1=Verified, 2=Rejected)
+        status_enum = 1 if status else 2
+        verification_type_enum = self._get_verification_type_enum(verification_type)
+        
+        # Record the event, and point the user's latest status at it
+        owner = _user_id_to_address(user_id)
+        event = VerificationEvent(
+            owner, verification_type_enum, status_enum, self.current_block, tx_hash, timestamp
+        )
+        self._pending_events.append(("VerificationUpdated", event))
+        self._latest_verification[(user_id, verification_type)] = event
+    
+    def _queue_event(self, event_name: str, args: Dict[str, Any], tx_hash: bytes) -> None:
+        """Queue an event emitted in the current block for the event log.
+        
+        Must be called with the block lock held.
+        """
+        self._pending_events.append((event_name, {
+            "args": args,
+            "blockNumber": self.current_block,
+            "transactionHash": tx_hash
+        }))
+    
+    def _flush_events(self) -> None:
+        """
+        Move queued events into self.events.
+        
+        Events are appended with one extend per event type; log indices and
+        the per-user index are assigned here, in queue order.
+        """
+        pending = self._pending_events
+        if not pending:
+            return
+        
+        with self._events_lock:
+            batches = defaultdict(list)
+            while pending:
+                event_name, event = pending.popleft()
+                batches[event_name].append(event)
+            
+            for event_name, batch in batches.items():
+                events = self.events[event_name]
+                start = len(events)
+                if event_name == "VerificationUpdated":
+                    events_by_user = self._events_by_user
+                    for log_index, event in enumerate(batch, start):
+                        event.log_index = log_index
+                        events_by_user[event.owner].append(log_index)
+                else:
+                    for log_index, event in enumerate(batch, start):
+                        event["logIndex"] = log_index
+                events.extend(batch)
+    
     def get_verification_status(self, user_id: str, verification_type: str) -> bool:
         """
         Get a user's verification status from the mock blockchain.
@@ -140,17 +274,61 @@ class BlockchainService:
             bool: The verification status (False if not found)
         """
         try:
-            # Check if we have a cached status
-            if user_id in self.verification_cache and verification_type in self.verification_cache[user_id]:
-                return self.verification_cache[user_id][verification_type]["status"]
-            
-            # If not in cache, return not verified
-            return False
+            # Latest recorded status, or not verified if there is no record
+            event = self._latest_verification.get((user_id, verification_type))
+            return event is not None and event.status == 1
             
         except Exception as e:
-            self.logger.error(f"Failed to get verification status: {e}")
+            self.logger.error("Failed to get verification status: %s", e)
             return False
     
+    def get_cached_verification(self, user_id: str, verification_type: str) -> Dict[str, Any]:
+        """
+        Get the cached record of a user's latest verification of a given type.
+        
+        Args:
+            user_id: The unique identifier for the user
+            verification_type: The type of verification
+            
+        Returns:
+            dict: The cached record (status, timestamp, transaction_hash,
+                block_number), or an empty dict if there is none
+        """
+        event = self._latest_verification.get((user_id, verification_type))
+        if event is None:
+            return {}
+        return {
+            "status": event.status == 1,
+            "timestamp": self._format_timestamp(event.timestamp),
+            "transaction_hash": self._tx_hex(event.transaction_hash),
+            "block_number": event.block_number
+        }
+    
+    def get_cached_access_grant(self, user_id: str, third_party_id: str) -> Dict[str, Any]:
+        """
+        Get the cached access grant from a user to a third party.
+        
+        Args:
+            user_id: The user who granted access
+            third_party_id: The third party that received access
+            
+        Returns:
+            dict: The cached grant record, or an empty dict if there is none
+        """
+        grant = self.access_grants_cache.get(user_id, {}).get(third_party_id)
+        if not grant:
+            return {}
+        return {
+            "data_types": grant["data_types_list"],
+            "granted_at": self._format_timestamp(grant["granted_at_ts"]),
+            "expires_at": self._format_timestamp(grant["expires_at_ts"]),
+            "transaction_hash": self._tx_hex(grant["transaction_hash"]),
+            "block_number": grant["block_number"],
+            "revoked_at": self._format_timestamp(grant.get("revoked_at_ts")),
+            "revoke_transaction_hash": self._tx_hex(grant.get("revoke_transaction_hash")),
+            "revoke_block_number": grant.get("revoke_block_number")
+        }
+    
     def grant_access(self, user_id: str, third_party_id: str, data_types: List[str], 
                      expiry_days: int = 30) -> bool:
         """
@@ -169,42 +347,39 @@ class BlockchainService:
             # Generate a mock transaction hash
             tx_hash = self._generate_mock_transaction_hash(user_id, third_party_id)
             
-            # Update the mock blockchain state
-            self.current_block += 1
-            
             # Calculate expiry timestamp
-            expiry_timestamp = int((datetime.now() + timedelta(days=expiry_days)).timestamp())
-            
-            # Create user entry if it doesn't exist
-            if user_id not in self.access_grants_cache:
-                self.access_grants_cache[user_id] = {}
-            
-            # Set the access grant with expiry
-            self.access_grants_cache[user_id][third_party_id] = {
-                "data_types": data_types,
-                "granted_at": datetime.now().isoformat(),
-                "expires_at": datetime.fromtimestamp(expiry_timestamp).isoformat(),
-                "transaction_hash": tx_hash,
-                "block_number": self.current_block
-            }
+            now = time.time()
+            expiry_timestamp = int(now) + expiry_days * SECONDS_PER_DAY
+            user_address = _user_id_to_address(user_id)
+            third_party_address = _user_id_to_address(third_party_id)
             
-            # Record the event for later querying
-            self.events["AccessGranted"].append({
-                "args": {
-                    "user": self._user_id_to_address(user_id),
-                    "thirdParty": self._user_id_to_address(third_party_id),
+            # Update the mock blockchain state
+            with self._block_lock:
+                self.current_block += 1
+                
+                # Set the access grant with expiry, creating the user entry if needed
+                self.access_grants_cache.setdefault(user_id, {})[third_party_id] = {
+                    # Set for O(1) membership checks; list keeps the granted order
+                    "data_types": frozenset(data_types),
+                    "data_types_list": list(data_types),
+                    "granted_at_ts": now,
+                    "expires_at_ts": expiry_timestamp,
+                    "transaction_hash": tx_hash,
+                    "block_number": self.current_block
+                }
+                
+                # Record the event for later querying
+                self._queue_event("AccessGranted", {
+                    "user": user_address,
+                    "thirdParty": third_party_address,
                     "expiryTimestamp": expiry_timestamp
-                },
-                "blockNumber": self.current_block,
-                "transactionHash": bytes.fromhex(tx_hash.replace("0x", "")),
-                "logIndex": len(self.events["AccessGranted"])
-            })
+                }, tx_hash)
             
-            self.logger.info(f"Granted access to {third_party_id} for user {user_id} data types: {data_types}")
+            self.logger.info("Granted access to %s for user %s data types: %s", third_party_id, user_id, data_types)
             return True
             
         except Exception as e:
-            self.logger.error(f"Failed to grant access: {e}")
+            self.logger.error("Failed to grant access: %s", e)
             return False
     
     def revoke_access(self, user_id: str, third_party_id: str) -> bool:
@@ -219,38 +394,37 @@ class BlockchainService:
             bool: True if access was revoked successfully
         """
         try:
-            # Check if access exists
-            if user_id not in self.access_grants_cache or third_party_id not in self.access_grants_cache[user_id]:
-                self.logger.warning(f"No access found to revoke for user {user_id} and third party {third_party_id}")
-                return False
-            
             # Generate a mock transaction hash
             tx_hash = self._generate_mock_transaction_hash(user_id, f"revoke:{third_party_id}")
-            
-            # Update the mock blockchain state
-            self.current_block += 1
-            
-            # Mark as revoked
-            self.access_grants_cache[user_id][third_party_id]["revoked_at"] = datetime.now().isoformat()
-            self.access_grants_cache[user_id][third_party_id]["revoke_transaction_hash"] = tx_hash
-            self.access_grants_cache[user_id][third_party_id]["revoke_block_number"] = self.current_block
-            
-            # Record the event for later querying
-            self.events["AccessRevoked"].append({
-                "args": {
-                    "user": self._user_id_to_address(user_id),
-                    "thirdParty": self._user_id_to_address(third_party_id)
-                },
-                "blockNumber": self.current_block,
-                "transactionHash": bytes.fromhex(tx_hash.replace("0x", "")),
-                "logIndex": len(self.events["AccessRevoked"])
-            })
-            
-            self.logger.info(f"Revoked access from {third_party_id} for user {user_id}")
+            user_address = _user_id_to_address(user_id)
+            third_party_address = _user_id_to_address(third_party_id)
+            
+            with self._block_lock:
+                # Check if access exists
+                grant = self.access_grants_cache.get(user_id, {}).get(third_party_id)
+                if grant is None:
+                    self.logger.warning("No access found to revoke for user %s and third party %s", user_id, third_party_id)
+                    return False
+                
+                # Update the mock blockchain state
+                self.current_block += 1
+                
+                # Mark as revoked
+                grant["revoked_at_ts"] = time.time()
+                grant["revoke_transaction_hash"] = tx_hash
+                grant["revoke_block_number"] = self.current_block
+                
+                # Record the event for later querying
+                self._queue_event("AccessRevoked", {
+                    "user": user_address,
+                    "thirdParty": third_party_address
+                }, tx_hash)
+            
+            self.logger.info("Revoked access from %s for user %s", third_party_id, user_id)
             return True
             
         except Exception as e:
-            self.logger.error(f"Failed to revoke access: {e}")
+            self.logger.error("Failed to revoke access: %s", e)
             return False
     
     def check_access(self, user_id: str, third_party_id: str, data_type: str) -> bool:
@@ -265,27 +439,20 @@ class BlockchainService:
         Returns:
             bool: True if access is granted and not expired
         """
-        try:
-            if user_id not in self.access_grants_cache or third_party_id not in self.access_grants_cache[user_id]:
-                return False
-            
-            access = self.access_grants_cache[user_id][third_party_id]
-            
-            # Check if access has been revoked
-            if "revoked_at" in access:
-                return False
-            
-            # Check if access has expired
-            expiry = datetime.fromisoformat(access["expires_at"])
-            if datetime.now() > expiry:
-                return False
-            
-            # Check if the requested data type is in the granted types
-            return data_type in access["data_types"]
-            
-        except Exception as e:
-            self.logger.error(f"Failed to check access: {e}")
+        # Plain lookups on records written by grant_access/revoke_access,
+        # so there is nothing to guard with try/except
+        grants = self.access_grants_cache.get(user_id)
+        if not grants:
             return False
+        
+        access = grants.get(third_party_id)
+        
+        # No grant, revoked, or expired
+        if access is None or "revoked_at_ts" in access or time.time() > access["expires_at_ts"]:
+            return False
+        
+        # Check if the requested data type is in the granted types
+        return data_type in access["data_types"]
     
     def record_zkp_verification(self, user_id: str, third_party_id: str, 
                                proof_hash: str, data_type: str) -> bool:
@@ -304,46 +471,45 @@ class BlockchainService:
         try:
             # Check if the third party has access
             if not self.check_access(user_id, third_party_id, data_type):
-                self.logger.warning(f"Third party {third_party_id} doesn't have access to {data_type} for user {user_id}")
+                self.logger.warning("Third party %s doesn't have access to %s for user %s", third_party_id, data_type, user_id)
                 return False
             
             # Generate a mock transaction hash
             tx_hash = self._generate_mock_transaction_hash(user_id, proof_hash)
             
-            # Update the mock blockchain state
-            self.current_block += 1
-            
-            # Record the verification
-            verification_record = {
-                "user_id": user_id,
-                "third_party_id": third_party_id,
-                "data_type": data_type,
-                "proof_hash": proof_hash,
-                "timestamp": datetime.now().isoformat(),
-                "transaction_hash": tx_hash,
-                "block_number": self.current_block
-            }
-            
-            self.zkp_verifications.append(verification_record)
-            
-            # Record the event for later querying
             data_type_bytes32 = proof_hash  # Simplified for mock
-            self.events["ZKProofVerified"].append({
-                "args": {
-                    "user": self._user_id_to_address(user_id),
-                    "verifier": self._user_id_to_address(third_party_id),
+            user_address = _user_id_to_address(user_id)
+            verifier_address = _user_id_to_address(third_party_id)
+            
+            # Update the mock blockchain state
+            with self._block_lock:
+                self.current_block += 1
+                
+                # Record the verification
+                verification_record = {
+                    "user_id": user_id,
+                    "third_party_id": third_party_id,
+                    "data_type": data_type,
+                    "proof_hash": proof_hash,
+                    "timestamp_ts": time.time(),
+                    "transaction_hash": tx_hash,
+                    "block_number": self.current_block
+                }
+                
+                self.zkp_verifications[user_id].append(verification_record)
+                
+                # Record the event for later querying
+                self._queue_event("ZKProofVerified", {
+                    "user": user_address,
+                    "verifier": verifier_address,
                     "dataType": data_type_bytes32
-                },
-                "blockNumber": self.current_block,
-                "transactionHash": bytes.fromhex(tx_hash.replace("0x", "")),
-                "logIndex": len(self.events["ZKProofVerified"])
-            })
+                }, tx_hash)
             
-            self.logger.info(f"Recorded ZKP verification for user {user_id} by {third_party_id}")
+            self.logger.info("Recorded ZKP verification for user %s by %s", user_id, third_party_id)
             return True
             
         except Exception as e:
-            self.logger.error(f"Failed to record ZKP verification: {e}")
+            self.logger.error("Failed to record ZKP verification: %s", e)
             return False
     
     def get_verification_history(self, user_id: str) -> List[Dict[str, Any]]:
@@ -357,28 +523,47 @@ class BlockchainService:
             List of verification records
         """
         try:
-            # Extract events for this user from our mock events storage
-            user_address = self._user_id_to_address(user_id)
-            verification_records = []
-            
-            # Get events related to this user
-            for event in self.events["VerificationUpdated"]:
-                if event["args"]["owner"].lower() == user_address.lower():
-                    verification_records.append({
-                        'user_id': user_id,
-                        'verification_type': self._get_verification_type_name(event["args"]["verificationType"]),
-                        'status': event["args"]["status"] == 1,  # 1 is Verified
-                        'timestamp': datetime.now().replace(minute=event["blockNumber"] % 60).isoformat(),  # Mock timestamp
-                        'transaction_hash': event["transactionHash"].hex(),
-                        'block_number': event["blockNumber"]
-                    })
-            
-            return verification_records
+            return list(self.iter_verification_history(user_id))
             
         except Exception as e:
-            self.logger.error(f"Failed to get verification history: {e}")
+            self.logger.error("Failed to get verification history: %s", e)
             return []
     
+    def iter_verification_history(self, user_id: str) -> Iterator[Dict[str, Any]]:
+        """
+        Return the verification records for a user as an iterator (mock implementation).
+        
+        Lets callers stream long histories without building the full list. The
+        user's events are looked up before this returns, so lookup errors are
+        raised here rather than partway through a stream.
+        
+        Args:
+            user_id: The user to get history for
+            
+        Returns:
+            Iterator of verification records, oldest first
+        """
+        # Look up this user's events through the per-user index
+        self._flush_events()
+        user_address = self._user_id_to_address(user_id)
+        events = self.events["VerificationUpdated"]
+        user_events = [events[index] for index in self._events_by_user.get(user_address, ())]
+        now = datetime.now()
+        
+        return (self._verification_event_response(user_id, event, now) for event in user_events)
+    
+    def _verification_event_response(self, user_id: str, event: VerificationEvent,
+                                     now: datetime) -> Dict[str, Any]:
+        """Format a VerificationUpdated event as a verification history record"""
+        return {
+            'user_id': user_id,
+            'verification_type': self._get_verification_type_name(event.verification_type),
+            'status': event.status == 1,  # 1 is Verified
+            'timestamp': now.replace(minute=event.block_number % 60).isoformat(),  # Mock timestamp
+            'transaction_hash': self._tx_hex(event.transaction_hash),
+            'block_number': event.block_number
+        }
+    
     def get_user_verification_audit(self, user_id: str) -> Dict[str, Any]:
         """
         Get a complete audit of a user's verifications and access grants.
@@ -408,13 +593,40 @@ class BlockchainService:
             }
             
         except Exception as e:
-            self.logger.error(f"Failed to get user verification audit: {e}")
+            self.logger.error("Failed to get user verification audit: %s", e)
             return {
                 'user_id': user_id,
                 'error': str(e),
                 'audit_generated_at': datetime.now().isoformat()
             }
     
+    def iter_user_verification_audit(self, user_id: str) -> List[Tuple[str, Any]]:
+        """
+        Get the sections of a user's audit as (name, value) pairs.
+        
+        The verification history and ZKP verifications are returned as iterators
+        so that callers can stream them instead of building the full audit.
+        Every section is looked up before this returns, so lookup errors are
+        raised here rather than partway through a stream.
+        
+        Args:
+            user_id: The user to get audit for
+            
+        Returns:
+            List of section name and value pairs, in the order of get_user_verification_audit
+        """
+        verification_history = self.iter_verification_history(user_id)
+        access_grants = self._get_user_access_grants(user_id)
+        zkp_records = self._user_zkp_records(user_id)
+        
+        return [
+            ('user_id', user_id),
+            ('verification_history', verification_history),
+            ('access_grants', access_grants),
+            ('zkp_verifications', (self._zkp_record_response(v) for v in zkp_records)),
+            ('audit_generated_at', datetime.now().isoformat())
+        ]
+    
     def _get_user_access_grants(self, user_id: str) -> List[Dict[str, Any]]:
         """Get access grants for a user (mock implementation)"""
         try:
@@ -426,46 +638,81 @@ class BlockchainService:
             for third_party_id, grant_data in self.access_grants_cache[user_id].items():
                 result.append({
                     'third_party_id': third_party_id,
-                    'granted_at': grant_data.get('granted_at'),
-                    'expires_at': grant_data.get('expires_at'),
-                    'transaction_hash': grant_data.get('transaction_hash'),
-                    'status': 'revoked' if 'revoked_at' in grant_data else 'active',
-                    'revoked_at': grant_data.get('revoked_at'),
-                    'revoke_transaction_hash': grant_data.get('revoke_transaction_hash')
+                    'granted_at': self._format_timestamp(grant_data.get('granted_at_ts')),
+                    'expires_at': self._format_timestamp(grant_data.get('expires_at_ts')),
+                    'transaction_hash': self._tx_hex(grant_data.get('transaction_hash')),
+                    'status': 'revoked' if 'revoked_at_ts' in grant_data else 'active',
+                    'revoked_at': self._format_timestamp(grant_data.get('revoked_at_ts')),
+                    'revoke_transaction_hash': self._tx_hex(grant_data.get('revoke_transaction_hash'))
                 })
             
             return result
             
         except Exception as e:
-            self.logger.error(f"Failed to get user access grants: {e}")
+            self.logger.error("Failed to get user access grants: %s", e)
             return []
     
     def _get_user_zkp_verifications(self, user_id: str) -> List[Dict[str, Any]]:
         """Get ZKP verifications for a user (mock implementation)"""
         try:
-            # Filter verifications for this user
-            return [v for v in self.zkp_verifications if v["user_id"] == user_id]
+            return [self._zkp_record_response(v) for v in self._user_zkp_records(user_id)]
             
         except Exception as e:
-            self.logger.error(f"Failed to get user ZKP verifications: {e}")
+            self.logger.error("Failed to get user ZKP verifications: %s", e)
             return []
     
-    def _generate_mock_transaction_hash(self, *args) -> str:
-        """Generate a mock blockchain transaction hash."""
+    def _user_zkp_records(self, user_id: str) -> List[Dict[str, Any]]:
+        """Drop a user's expired ZKP records and return a snapshot of the rest"""
+        records = self.zkp_verifications.get(user_id)
+        if not records:
+            return []
+        
+        # Records are appended in time order, so expired ones are at the front.
+        # Trimming and copying hold the block lock that appends hold, so that
+        # concurrent readers cannot both pop one expired head
+        cutoff = time.time() - ZKP_RECORD_TTL
+        with self._block_lock:
+            while records and records[0]["timestamp_ts"] < cutoff:
+                records.popleft()
+            return list(records)
+    
+    def _zkp_record_response(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """Format a stored ZKP verification record for API responses"""
+        return {
+            "user_id": record["user_id"],
+            "third_party_id": record["third_party_id"],
+            "data_type": record["data_type"],
+            "proof_hash": record["proof_hash"],
+            "timestamp": self._format_timestamp(record["timestamp_ts"]),
+            "transaction_hash": self._tx_hex(record["transaction_hash"]),
+            "block_number": record["block_number"]
+        }
+    
+    def _generate_mock_transaction_hash(self, *args) -> bytes:
+        """Generate a mock blockchain transaction hash as 32 raw bytes."""
         # In a real implementation, this would be the hash returned by the blockchain
-        combined = str(args) + str(time.time()) + str(uuid.uuid4())
-        return "0x" + hashlib.sha256(combined.encode()).hexdigest()
+        h = hashlib.sha256(self._tx_nonce)
+        h.update(next(self._tx_counter).to_bytes(8, "big"))
+        h.update(repr(args).encode())
+        return h.digest()
+    
+    @staticmethod
+    def _tx_hex(tx_hash: Optional[bytes]) -> Optional[str]:
+        """Format a raw transaction hash as a 0x-prefixed hex string"""
+        if tx_hash is None:
+            return None
+        return "0x" + tx_hash.hex()
+    
+    @staticmethod
+    def _format_timestamp(timestamp: Optional[float]) -> Optional[str]:
+        """Format an epoch timestamp as a local ISO 8601 string"""
+        if timestamp is None:
+            return None
+        return datetime.fromtimestamp(timestamp).isoformat()
     
     def _user_id_to_address(self, user_id: str) -> str:
         """Convert a user ID to an Ethereum address"""
-        # If it's already an Ethereum address, return it
-        if user_id.startswith("0x") and len(user_id) == 42:
-            return user_id
-        
-        # Otherwise, derive an address from the user ID
-        h = hashlib.sha256(user_id.encode()).digest()
-        addr = '0x' + h[-20:].hex()
-        return addr
+        return _user_id_to_address(user_id)
     
     def _address_to_user_id(self, address: str) -> str:
         """Convert an Ethereum address to a user ID"""
@@ -475,24 +722,45 @@ class BlockchainService:
     
     def _get_verification_type_enum(self, verification_type: str) -> int:
         """Map verification type string to enum value used in contract"""
-        mapping = {
-            'government_id': 0,
-            'document': 0,  # Alias for government_id
-            'biometric': 1,
-            'facial': 1,    # Alias for biometric
-            'address': 2
-        }
-        return mapping.get(verification_type.lower(), 0)
+        # Types are normally already lowercase; only lowercase on a miss
+        enum_value = _VERIFICATION_TYPE_ENUMS.get(verification_type)
+        if enum_value is None:
+            enum_value = _VERIFICATION_TYPE_ENUMS.get(verification_type.lower(), 0)
+        return enum_value
     
     def _get_verification_type_name(self, verification_type_enum: int) -> str:
         """Map verification type enum to string name"""
-        mapping = {
-            0: 'government_id',
-            1: 'biometric',
-            2: 'address'
-        }
-        return mapping.get(verification_type_enum, 'unknown')
+        return _VERIFICATION_TYPE_NAMES.get(verification_type_enum, 'unknown')
+
+
+@lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def _user_id_to_address(user_id: str) -> str:
+    """
+    Convert a user ID to an Ethereum address.
+    
+    The derivation is pure, so results are memoized: the same few user IDs
+    come up on every write, access check and history query.
+    """
+    # If it's already an Ethereum address, return it in lowercase like derived ones
+    if user_id.startswith("0x") and len(user_id) == 42:
+        return user_id.lower()
+    
+    # Otherwise, derive an address from the user ID
+    h = hashlib.sha256(user_id.encode()).digest()
+    return '0x' + h[-20:].hex()
+
+
+def _read_config_file() -> Dict:
+    """Read the local blockchain config file, or return an empty dict if unavailable"""
+    try:
+        with open(CONFIG_PATH, "rb") as f:
+            return orjson.loads(f.read())
+    except (FileNotFoundError, orjson.JSONDecodeError) as e:
+        logger.warning("Could not load blockchain config from file: %s", e)
+        return {}
+
 
+_FILE_CONFIG = _read_config_file()
 
 # Initialize the singleton instance
 blockchain_service = BlockchainService() 
\ No newline at end of file
@@ -0,0 +1,52 @@
+"""
+Thread pools used to run blocking service calls off the event loop.
+
+The pools are created on first use and recreated after shutdown_executors(),
+so the app can be started again in the same process (as test clients do).
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+# Blockchain and other network-bound calls spend most of their time waiting,
+# so they get a large pool of their own
+IO_EXECUTOR_SIZE = 128
+
+# Biometric and fraud analysis are compute-bound; more threads than cores
+# only adds contention
+CPU_EXECUTOR_SIZE = os.cpu_count() or 4
+
+_io_executor: Optional[ThreadPoolExecutor] = None
+_cpu_executor: Optional[ThreadPoolExecutor] = None
+_executors_lock = threading.Lock()
+
+
+def get_io_executor() -> ThreadPoolExecutor:
+    """Return the pool for network-bound service calls, creating it if needed."""
+    global _io_executor
+    with _executors_lock:
+        if _io_executor is None:
+            _io_executor = ThreadPoolExecutor(max_workers=IO_EXECUTOR_SIZE, thread_name_prefix="io")
+        return _io_executor
+
+
+def get_cpu_executor() -> ThreadPoolExecutor:
+    """Return the pool for compute-bound service calls, creating it if needed."""
+    global _cpu_executor
+    with _executors_lock:
+        if _cpu_executor is None:
+            _cpu_executor = ThreadPoolExecutor(max_workers=CPU_EXECUTOR_SIZE, thread_name_prefix="cpu")
+        return _cpu_executor
+
+
+def shutdown_executors():
+    """Wait for in-flight service calls and stop both pools."""
+    global _io_executor, _cpu_executor
+    with _executors_lock:
+        executors = (_io_executor, _cpu_executor)
+        _io_executor = _cpu_executor = None
+    for executor in executors:
+        if executor is not None:
+            executor.shutdown(wait=True)
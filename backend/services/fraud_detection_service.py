@@ -7,13 +7,13 @@ import numpy as np
 import cv2
 import os
 import io
+import mmap
 import json
 import hashlib
+import threading
 import uuid
 from datetime import datetime, timedelta
-import tensorflow as tf
-from typing import Dict, List, Optional, Any, Tuple
-from PIL import Image
+from typing import Dict, List, Optional, Any, Tuple, Union, BinaryIO
 
 # Establish logger
 logger = logging.getLogger(__name__)
@@ -41,7 +41,9 @@ class FraudDetectionService:
         self.anomaly_detection_model = self._load_anomaly_detection_model()
         
         # Store verification attempts for pattern recognition
+        # Analyses run on worker threads, so history writes are serialized
         self.verification_attempts = {}
+        self._history_lock = threading.Lock()
         
         # Known fraud patterns (would be updated regularly in real implementation)
         self.fraud_patterns = self._load_fraud_patterns()
@@ -108,7 +110,7 @@ class FraudDetectionService:
             return MockImageManipulationModel()
             
         except Exception as e:
-            logger.error(f"Failed to load image manipulation detection model: {e}")
+            logger.error("Failed to load image manipulation detection model: %s", e)
             return None
     
     def _load_anomaly_detection_model(self) -> Any:
@@ -136,21 +138,29 @@ class FraudDetectionService:
                     """
                     anomaly_score = 0.0
                     factors = []
+                    history = user_data.get("verification_history", [])
+                    
+                    # Extract all history features in one pass, parsing each
+                    # timestamp once instead of once per check
+                    hour_counts = {}
+                    attempt_count_today = 0
+                    unique_devices = set()
+                    unique_ips = set()
+                    today = datetime.now().date()
+                    for attempt in history:
+                        unique_devices.add(attempt.get("device_fingerprint", ""))
+                        unique_ips.add(attempt.get("ip_address", ""))
+                        try:
+                            time = datetime.fromisoformat(attempt.get("timestamp"))
+                        except (TypeError, ValueError):
+                            continue
+                        hour_counts[time.hour] = hour_counts.get(time.hour, 0) + 1
+                        if time.date() == today:
+                            attempt_count_today += 1
                     
                     # Check time of day unusual for this user
-                    if user_data.get("verification_history"):
-                        time_now = datetime.fromisoformat(current_attempt.get("timestamp"))
-                        hour_now = time_now.hour
-                        
-                        # Calculate historical hour distribution
-                        hour_counts = {}
-                        for attempt in user_data.get("verification_history", []):
-                            try:
-                                time = datetime.fromisoformat(attempt.get("timestamp"))
-                                hour = time.hour
-                                hour_counts[hour] = hour_counts.get(hour, 0) + 1
-                            except:
-                                pass
+                    if history:
+                        hour_now = datetime.fromisoformat(current_attempt.get("timestamp")).hour
                         
                         # If user rarely verifies at this hour
                         if hour_counts.get(hour_now, 0) < 2:
@@ -158,27 +168,10 @@ class FraudDetectionService:
                             factors.append("unusual_time")
                     
                     # Check frequency of attempts
-                    attempt_count_today = 0
-                    today = datetime.now().date()
-                    for attempt in user_data.get("verification_history", []):
-                        try:
-                            time = datetime.fromisoformat(attempt.get("timestamp"))
-                            if time.date() == today:
-                                attempt_count_today += 1
-                        except:
-                            pass
-                    
                     if attempt_count_today > 3:  # Unusually high number of attempts
                         anomaly_score += min(0.4, (attempt_count_today - 3) * 0.1)
                         factors.append("high_frequency")
                     
-                    # Check for multiple device/location anomalies
-                    unique_devices = set()
-                    unique_ips = set()
-                    for attempt in user_data.get("verification_history", []):
-                        unique_devices.add(attempt.get("device_fingerprint", ""))
-                        unique_ips.add(attempt.get("ip_address", ""))
-                    
                     # New device never seen before
                     if current_attempt.get("device_fingerprint") not in unique_devices:
                         anomaly_score += 0.3
@@ -201,7 +194,7 @@ class FraudDetectionService:
             return MockAnomalyDetectionModel()
             
         except Exception as e:
-            logger.error(f"Failed to load anomaly detection model: {e}")
+            logger.error("Failed to load anomaly detection model: %s", e)
             return None
     
     def _load_fraud_patterns(self) -> Dict:
@@ -221,29 +214,71 @@ class FraudDetectionService:
                     "45.227.253.0/24"
                 ],
                 "image_hashes": [
-                    # Hashes of known fake or misused images
-                    "e34a8899ef6b983a1882b1167a4b2500",
-                    "d41d8cd98f00b204e9800998ecf8427e"
+                    # SHA-256 hashes of known fake or misused images
+                    # Empty file (MD5 d41d8cd98f00b204e9800998ecf8427e)
+                    "e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855"
                 ]
             }
         except Exception as e:
-            logger.error(f"Failed to load fraud patterns: {e}")
+            logger.error("Failed to load fraud patterns: %s", e)
             return {}
     
+    def warm_up(self):
+        """
+        Run the detection models once on dummy inputs
+        
+        First-call initialization of the image and anomaly models happens here
+        instead of during the first verification request. Nothing is recorded
+        in the verification history.
+        """
+        try:
+            if self.image_manipulation_model:
+                self.image_manipulation_model.predict(np.zeros((128, 128, 3), dtype=np.uint8))
+            if self.anomaly_detection_model:
+                self.anomaly_detection_model.predict({"verification_history": []}, {})
+            logger.info("Fraud detection models warmed up")
+        except Exception as e:
+            logger.error("Error warming up fraud detection models: %s", e)
+    
     def analyze_verification_attempt(self, user_id: str, verification_data: Dict, 
-                                      image_data: Optional[bytes] = None) -> Dict:
+                                      image_data: Optional[Union[bytes, BinaryIO]] = None) -> Dict:
         """
         Analyze an identity verification attempt for potential fraud
         
+        Runs the metadata checks of preflight() followed by the image analysis
+        of analyze_image().
+        
         Args:
             user_id: The ID of the user being verified
             verification_data: Data about the verification attempt 
-                (device info, timestamps, etc.)
-            image_data: Optional image data to analyze for manipulation
+                (device info, timestamps, image_hash, etc.)
+            image_data: Optional image bytes or binary file object to analyze for manipulation
             
         Returns:
             Analysis results including risk score and identified threats
         """
+        result = self.preflight(user_id, verification_data)
+        if result["risk_level"] == "high" or "error" in result:
+            return result
+        return self.analyze_image(user_id, verification_data, image_data, result)
+    
+    def preflight(self, user_id: str, verification_data: Dict) -> Dict:
+        """
+        Run the cheap fraud checks that need no image
+        
+        Covers known fraudulent image hashes, behavioral anomalies and device and
+        network reputation. Risk only accumulates, so a "high" result here is
+        final: the attempt is stored and callers can skip image analysis and
+        biometric matching altogether.
+        
+        Args:
+            user_id: The ID of the user being verified
+            verification_data: Data about the verification attempt 
+                (device info, timestamps, image_hash, etc.)
+            
+        Returns:
+            Partial analysis results to pass to analyze_image()
+        """
         try:
             # Initialize result dictionary
             result = {
@@ -255,23 +290,20 @@ class FraudDetectionService:
                 "verification_id": str(uuid.uuid4())
             }
             
-            # 1. Image manipulation detection (if image provided)
-            if image_data is not None and self.image_manipulation_model:
-                manip_score = self._analyze_image_manipulation(image_data)
-                result["image_manipulation_score"] = float(manip_score)
-                
-                if manip_score > 0.7:  # High confidence of manipulation
-                    result["threats_detected"].append({
-                        "type": "image_manipulation",
-                        "confidence": float(manip_score),
-                        "description": "Possible digital manipulation of verification image"
-                    })
-                    result["risk_score"] += manip_score * 0.4  # Image manipulation has high weight
+            # Known fraudulent image (SHA-256 computed while the upload was streamed)
+            image_hash = verification_data.get("image_hash")
+            if image_hash and image_hash in self.fraud_patterns.get("image_hashes", []):
+                result["threats_detected"].append({
+                    "type": "known_fraudulent_image",
+                    "confidence": 1.0,
+                    "description": "Verification image matches a known fraudulent image"
+                })
+                result["risk_score"] += 0.8
             
-            # 2. Load user history and device fingerprint analysis
+            # Load user history and device fingerprint analysis
             user_data = self._get_user_verification_history(user_id)
             
-            # 3. Behavioral anomaly detection
+            # Behavioral anomaly detection
             if self.anomaly_detection_model:
                 anomaly_result = self._detect_behavioral_anomalies(user_data, verification_data)
                 result["anomaly_score"] = float(anomaly_result["score"])
@@ -284,7 +316,7 @@ class FraudDetectionService:
                     })
                     result["risk_score"] += anomaly_result["score"] * 0.3
             
-            # 4. Device and network analysis
+            # Device and network analysis
             device_risk = self._analyze_device_and_network(verification_data)
             result["device_risk_score"] = float(device_risk["score"])
             
@@ -296,14 +328,49 @@ class FraudDetectionService:
                 })
                 result["risk_score"] += device_risk["score"] * 0.3
             
-            # Update risk level based on final risk score
-            result["risk_score"] = min(1.0, result["risk_score"])
-            if result["risk_score"] >= self.risk_thresholds["high"]:
-                result["risk_level"] = "high"
-            elif result["risk_score"] >= self.risk_thresholds["medium"]:
-                result["risk_level"] = "medium"
-            else:
-                result["risk_level"] = "low"
+            self._update_risk_level(result)
+            
+            # A high-risk attempt is final, so store it now
+            if result["risk_level"] == "high":
+                self._store_verification_attempt(user_id, verification_data, result)
+            
+            return result
+            
+        except Exception as e:
+            logger.error("Error analyzing verification attempt: %s", e)
+            return self._analysis_error_result(user_id, e)
+    
+    def analyze_image(self, user_id: str, verification_data: Dict,
+                      image_data: Optional[Union[bytes, BinaryIO]], preflight_result: Dict) -> Dict:
+        """
+        Complete a preflight analysis with image manipulation detection
+        
+        Args:
+            user_id: The ID of the user being verified
+            verification_data: Data about the verification attempt
+            image_data: Optional image bytes or binary file object to analyze for manipulation
+            preflight_result: Result of preflight() for the same attempt
+            
+        Returns:
+            Analysis results including risk score and identified threats
+        """
+        try:
+            result = preflight_result
+            
+            # Image manipulation detection (if image provided)
+            if image_data is not None and self.image_manipulation_model:
+                manip_score = self._analyze_image_manipulation(image_data)
+                result["image_manipulation_score"] = float(manip_score)
+                
+                if manip_score > 0.7:  # High confidence of manipulation
+                    result["threats_detected"].append({
+                        "type": "image_manipulation",
+                        "confidence": float(manip_score),
+                        "description": "Possible digital manipulation of verification image"
+                    })
+                    result["risk_score"] += manip_score * 0.4  # Image manipulation has high weight
+            
+            self._update_risk_level(result)
             
             # Store the verification attempt for future analysis
             self._store_verification_attempt(user_id, verification_data, result)
@@ -311,42 +378,69 @@ class FraudDetectionService:
             return result
             
         except Exception as e:
-            logger.error(f"Error analyzing verification attempt: {e}")
-            return {
-                "user_id": user_id,
-                "timestamp": datetime.now().isoformat(),
-                "risk_score": 0.5,  # Default to medium risk when analysis fails
-                "risk_level": "medium",
-                "threats_detected": [{
-                    "type": "analysis_error",
-                    "confidence": 1.0,
-                    "description": f"Error during fraud analysis: {str(e)}"
-                }],
-                "verification_id": str(uuid.uuid4()),
-                "error": str(e)
-            }
+            logger.error("Error analyzing verification attempt: %s", e)
+            return self._analysis_error_result(user_id, e)
+    
+    def _update_risk_level(self, result: Dict):
+        """Cap the accumulated risk score and derive the risk level from it"""
+        # The model scores are numpy floats, which orjson does not serialize
+        result["risk_score"] = float(min(1.0, result["risk_score"]))
+        if result["risk_score"] >= self.risk_thresholds["high"]:
+            result["risk_level"] = "high"
+        elif result["risk_score"] >= self.risk_thresholds["medium"]:
+            result["risk_level"] = "medium"
+        else:
+            result["risk_level"] = "low"
     
-    def _analyze_image_manipulation(self, image_data: bytes) -> float:
+    def _analysis_error_result(self, user_id: str, error: Exception) -> Dict:
+        """Build the result reported when fraud analysis fails"""
+        return {
+            "user_id": user_id,
+            "timestamp": datetime.now().isoformat(),
+            "risk_score": 0.5,  # Default to medium risk when analysis fails
+            "risk_level": "medium",
+            "threats_detected": [{
+                "type": "analysis_error",
+                "confidence": 1.0,
+                "description": f"Error during fraud analysis: {str(error)}"
+            }],
+            "verification_id": str(uuid.uuid4()),
+            "error": str(error)
+        }
+    
+    def _analyze_image_manipulation(self, image_data: Union[bytes, BinaryIO]) -> float:
         """Analyze image for signs of manipulation"""
         try:
-            # Convert image bytes to numpy array
-            image = np.array(Image.open(io.BytesIO(image_data)))
+            # Accept raw bytes, an in-memory or memory-mapped upload, or any
+            # other file object; only the latter has to be read into memory
+            if isinstance(image_data, io.BytesIO):
+                buffer = image_data.getbuffer()
+            elif isinstance(image_data, (bytes, bytearray, memoryview, mmap.mmap)):
+                buffer = image_data
+            else:
+                image_data.seek(0)
+                buffer = image_data.read()
+            
+            # Decode with OpenCV's SIMD decoder straight to grayscale, which is
+            # all the manipulation model looks at
+            image = cv2.imdecode(np.frombuffer(buffer, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+            if image is None:
+                raise ValueError("Unsupported or corrupt image data")
             
             # Use the model to predict manipulation probability
             manip_score = self.image_manipulation_model.predict(image)
             
             return float(manip_score)
         except Exception as e:
-            logger.error(f"Error analyzing image manipulation: {e}")
+            logger.error("Error analyzing image manipulation: %s", e)
             return 0.5  # Default medium risk
     
     def _get_user_verification_history(self, user_id: str) -> Dict:
         """Retrieve user's verification history"""
-        if user_id not in self.verification_attempts:
-            self.verification_attempts[user_id] = {
-                "verification_history": []
-            }
-        return self.verification_attempts[user_id]
+        # setdefault keeps concurrent first attempts from replacing each other's record
+        return self.verification_attempts.setdefault(user_id, {
+            "verification_history": []
+        })
     
     def _detect_behavioral_anomalies(self, user_data: Dict, current_attempt: Dict) -> Dict:
         """Detect anomalies in verification behavior"""
@@ -360,10 +454,11 @@ class FraudDetectionService:
             score = 0.0
             factors = []
             
-            # Check device fingerprint against known fraud patterns
-            device_fp = verification_data.get("device_fingerprint", "")
+            # Check the device against known fraud patterns. The fingerprint is a
+            # digest, so the patterns are matched against the raw user agent.
+            user_agent = verification_data.get("user_agent", "")
             for suspicious_pattern in self.fraud_patterns.get("device_fingerprints", []):
-                if suspicious_pattern in device_fp:
+                if suspicious_pattern in user_agent:
                     score += 0.7
                     factors.append(f"suspicious_device_pattern:{suspicious_pattern}")
                     break
@@ -397,16 +492,11 @@ class FraudDetectionService:
             }
             
         except Exception as e:
-            logger.error(f"Error analyzing device and network: {e}")
+            logger.error("Error analyzing device and network: %s", e)
             return {"score": 0.2, "factors": ["analysis_error"]}
     
     def _store_verification_attempt(self, user_id: str, verification_data: Dict, analysis_result: Dict):
         """Store verification attempt for future analysis"""
-        if user_id not in self.verification_attempts:
-            self.verification_attempts[user_id] = {
-                "verification_history": []
-            }
-        
         # Store relevant details but not the full analysis
         attempt_record = {
             "timestamp": verification_data.get("timestamp", datetime.now().isoformat()),
@@ -417,13 +507,19 @@ class FraudDetectionService:
             "verification_id": analysis_result.get("verification_id", "")
         }
         
-        self.verification_attempts[user_id]["verification_history"].append(attempt_record)
-        
-        # Limit history size to prevent memory issues
-        max_history = 20
-        if len(self.verification_attempts[user_id]["verification_history"]) > max_history:
-            self.verification_attempts[user_id]["verification_history"] = \
-                self.verification_attempts[user_id]["verification_history"][-max_history:]
+        with self._history_lock:
+            if user_id not in self.verification_attempts:
+                self.verification_attempts[user_id] = {
+                    "verification_history": []
+                }
+            
+            self.verification_attempts[user_id]["verification_history"].append(attempt_record)
+            
+            # Limit history size to prevent memory issues
+            max_history = 20
+            if len(self.verification_attempts[user_id]["verification_history"]) > max_history:
+                self.verification_attempts[user_id]["verification_history"] = \
+                    self.verification_attempts[user_id]["verification_history"][-max_history:]
     
     def update_fraud_patterns(self):
         """
@@ -445,7 +541,7 @@ class FraudDetectionService:
                 
             return True
         except Exception as e:
-            logger.error(f"Failed to update fraud patterns: {e}")
+            logger.error("Failed to update fraud patterns: %s", e)
             return False
     
     def get_user_risk_profile(self, user_id: str) -> Dict:
@@ -493,7 +589,7 @@ class FraudDetectionService:
             }
             
         except Exception as e:
-            logger.error(f"Error getting user risk profile: {e}")
+            logger.error("Error getting user risk profile: %s", e)
             return {
                 "user_id": user_id,
                 "risk_level": "unknown",
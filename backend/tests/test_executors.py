@@ -0,0 +1,14 @@
+from backend.services import executors
+
+
+def test_executors_are_recreated_after_shutdown():
+    """A second app lifespan in the same process gets working pools again."""
+    io_executor = executors.get_io_executor()
+    cpu_executor = executors.get_cpu_executor()
+    executors.shutdown_executors()
+
+    assert executors.get_io_executor() is not io_executor
+    assert executors.get_cpu_executor() is not cpu_executor
+    assert executors.get_io_executor().submit(lambda: "io").result() == "io"
+    assert executors.get_cpu_executor().submit(lambda: "cpu").result() == "cpu"
+    executors.shutdown_executors()
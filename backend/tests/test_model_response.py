@@ -0,0 +1,22 @@
+import json
+
+import numpy as np
+
+from backend.routers.verification_router import VerificationResponse, _model_response
+
+
+def test_model_response_serializes_numpy_scores():
+    """Scores accumulated from numpy model outputs are sent as plain JSON numbers."""
+    response = _model_response(VerificationResponse.model_construct(
+        success=True,
+        message="Face verification successful",
+        transaction_hash="0xabc",
+        risk_level="high",
+        risk_score=np.float64(0.85),
+        verification_id="verification-1"
+    ))
+
+    assert response.status_code == 200
+    body = json.loads(response.body)
+    assert body["risk_score"] == 0.85
+    assert body["risk_level"] == "high"
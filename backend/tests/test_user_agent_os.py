@@ -0,0 +1,25 @@
+import pytest
+
+from backend.routers.verification_router import _extract_os_from_user_agent
+
+
+@pytest.mark.parametrize("user_agent, expected_os", [
+    # Mobile platforms win over the desktop tokens their user agents also contain
+    ("Mozilla/5.0 (Linux; Android 13; Pixel 7) AppleWebKit/537.36 Mobile Safari/537.36", "android"),
+    ("Mozilla/5.0 (iPhone; CPU iPhone OS 16_5 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148", "ios"),
+    ("Mozilla/5.0 (iPad; CPU OS 16_5 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148", "ios"),
+    # Desktop platforms
+    ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/115.0 Safari/537.36", "windows"),
+    ("Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 Safari/605.1.15", "macos"),
+    ("Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 Chrome/115.0 Safari/537.36", "linux"),
+    # Native apps that only name the platform
+    ("VerifyApp/2.1 (iOS 17.0)", "ios"),
+    # Matching is case-insensitive
+    ("SOMECLIENT (WINDOWS)", "windows"),
+    # Nothing recognizable
+    ("curl/8.1.2", "unknown"),
+    ("", "unknown"),
+])
+def test_extract_os_from_user_agent(user_agent, expected_os):
+    """The highest-priority OS token in the user agent decides the OS."""
+    assert _extract_os_from_user_agent(user_agent) == expected_os
@@ -0,0 +1,102 @@
+import asyncio
+
+from backend.routers import verification_router
+
+
+def _run_writer(updates, batch_results, monkeypatch, batch_size=64):
+    """Queue updates and a stop sentinel, run the writer, and return the batches it recorded."""
+    batches = []
+    results = iter(batch_results)
+
+    def record_batch(batch):
+        batches.append(batch)
+        return next(results)
+
+    monkeypatch.setattr(verification_router, "VERIFICATION_WRITE_FLUSH_INTERVAL", 0)
+    monkeypatch.setattr(verification_router, "VERIFICATION_WRITE_BATCH_SIZE", batch_size)
+    monkeypatch.setattr(verification_router.blockchain_service,
+                        "update_verification_status_batch", record_batch)
+    monkeypatch.setattr(verification_router.blockchain_service, "get_cached_verification",
+                        lambda user_id, verification_type: {"transaction_hash": "0xabc"})
+
+    async def run():
+        queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        futures = []
+        for update in updates:
+            future = loop.create_future()
+            futures.append(future)
+            queue.put_nowait((*update, future))
+        queue.put_nowait(None)
+
+        await asyncio.wait_for(verification_router._verification_writer(queue), timeout=5)
+        return [future.result() for future in futures]
+
+    return batches, asyncio.run(run())
+
+
+def test_writer_flushes_queued_updates_before_stopping(monkeypatch):
+    """Updates queued before the sentinel are recorded in one batch, then the writer stops."""
+    updates = [("alice", "facial", True), ("bob", "document", False), ("carol", "facial", True)]
+
+    batches, results = _run_writer(updates, [True], monkeypatch)
+
+    assert batches == [updates]
+    assert results == [(True, "0xabc")] * 3
+
+
+def test_writer_splits_batches_at_batch_size(monkeypatch):
+    """A flush larger than the batch size is recorded in several transactions."""
+    updates = [(f"user{i}", "facial", True) for i in range(5)]
+
+    batches, results = _run_writer(updates, [True, True, True], monkeypatch, batch_size=2)
+
+    assert batches == [updates[0:2], updates[2:4], updates[4:5]]
+    assert len(results) == 5
+
+
+def test_writer_reports_failed_batches(monkeypatch):
+    """Every request in a failed batch is told its write was not recorded."""
+    updates = [("alice", "facial", True), ("bob", "facial", True)]
+
+    _, results = _run_writer(updates, [False], monkeypatch)
+
+    assert results == [(False, None), (False, None)]
+
+
+def test_writer_stops_on_sentinel_with_empty_queue(monkeypatch):
+    """The sentinel alone stops the writer without recording anything."""
+    batches, results = _run_writer([], [], monkeypatch)
+
+    assert batches == []
+    assert results == []
+
+
+def test_writes_during_shutdown_are_recorded_directly(monkeypatch):
+    """A write arriving while the writer drains does not wait on the stopped writer."""
+    batches = []
+    direct_writes = []
+    monkeypatch.setattr(verification_router, "VERIFICATION_WRITE_FLUSH_INTERVAL", 0)
+    monkeypatch.setattr(verification_router.blockchain_service, "update_verification_status_batch",
+                        lambda batch: batches.append(batch) or True)
+    monkeypatch.setattr(verification_router.blockchain_service, "update_verification_status",
+                        lambda *update: direct_writes.append(update) or True)
+    monkeypatch.setattr(verification_router.blockchain_service, "get_cached_verification",
+                        lambda user_id, verification_type: {"transaction_hash": "0xabc"})
+
+    async def run():
+        await verification_router.start_verification_writer()
+        queued = asyncio.ensure_future(
+            verification_router._record_verification_status("alice", "facial", True)
+        )
+        await asyncio.sleep(0)
+        stopping = asyncio.ensure_future(verification_router.stop_verification_writer())
+        await asyncio.sleep(0)
+        late = verification_router._record_verification_status("bob", "facial", True)
+        return await asyncio.wait_for(asyncio.gather(queued, late, stopping), timeout=5)
+
+    queued_hash, late_hash, _ = asyncio.run(run())
+
+    assert (queued_hash, late_hash) == ("0xabc", "0xabc")
+    assert batches == [[("alice", "facial", True)]]
+    assert direct_writes == [("bob", "facial", True)]